@@ -24,7 +24,12 @@ def sym_ramp_envelope(t: np.ndarray,
     :param t: Array of timesteps.
     :param scale: Not used.
     """
-    return 1 - np.abs(2 * t / t[-1] - 1)
+    # evaluated in place in a single buffer
+    envelope = np.multiply(t, 2 / t[-1])
+    envelope -= 1
+    np.abs(envelope, out=envelope)
+    np.subtract(1, envelope, out=envelope)
+    return envelope
 
 
 def linear_exp_envelope(t: np.ndarray,
@@ -38,4 +43,9 @@ def linear_exp_envelope(t: np.ndarray,
     """
     if scale is None:
         scale = 1
-    return (t / scale) * np.exp(1 - t / scale)
+
+    envelope = np.divide(t, scale)
+    decay = np.subtract(1, envelope)
+    np.exp(decay, out=decay)
+    envelope *= decay
+    return envelope
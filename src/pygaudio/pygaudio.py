@@ -1,11 +1,33 @@
-from typing import Callable, Optional
+import time
+from typing import Callable, Iterator, List, Optional, Tuple
 
 import numpy as np
 import pygame
 
+from .envelopes import constant_envelope
+
+
+def _aligned_zeros(size: int, alignment: Optional[int] = None) -> np.ndarray:
+    """
+    Zeroed float32 array with data starting on an alignment boundary, so
+        vectorised loops can use aligned SIMD loads.
+    :param size: Number of elements.
+    :param alignment: (Optional) Alignment in bytes. Defaults to 64.
+    """
+    if alignment is None:
+        alignment = 64
+    itemsize = np.dtype(np.float32).itemsize
+    buffer = np.zeros(size + alignment // itemsize, dtype=np.float32)
+    offset = (-buffer.ctypes.data % alignment) // itemsize
+    return buffer[offset:offset+size]
+
 
 class PygAudio:
     max_amp = 32767
+    # samples per tile when building waves, small enough to stay in cache
+    tile_size = 8192
+    # frames per chunk when streaming audio to the mixer
+    stream_chunk = 65536
 
     def __init__(self, num_channels: Optional[int] = None,
                  sample_rate: Optional[int] = None,
@@ -30,6 +52,7 @@ class PygAudio:
         self.relative_amp = relative_amp
         self.t = None
         self.collected_amp = None
+        self.side_amp = None
         pygame.mixer.init(frequency=sample_rate, buffer=4096)
 
     def construct_time(self, seconds: float) -> float:
@@ -38,12 +61,19 @@ class PygAudio:
         :param seconds: Total number of seconds to play audio for.
         :return: Length of each timestep (between samples).
         """
-        self.t = np.linspace(0, seconds, int(self.sample_rate * seconds),
-                             dtype=np.float64)
+        self.timestep = 1 / self.sample_rate
+        # sample i sits at exactly i / sample_rate, kept in double precision
+        # so neighbouring samples stay distinct on long clips
+        self.t = np.arange(int(self.sample_rate * seconds), dtype=np.float64)
+        self.t /= self.sample_rate
 
-        self.collected_amp = np.zeros((len(self.t), self.num_channels),
-                                      dtype=np.float64)
-        self.timestep = self.t[1] - self.t[0]
+        # audio common to both channels, stereo differences are kept
+        # separately in side_amp and only allocated once needed, so the
+        # usual "both" channel waves are only written once. Buffers are
+        # 64-byte aligned, and so is every tile as tile_size is a multiple of
+        # 16 samples
+        self.collected_amp = _aligned_zeros(len(self.t))
+        self.side_amp = None
         return self.timestep
 
     def create_wave(self, wave_func: Callable[[np.ndarray,
@@ -63,7 +93,8 @@ class PygAudio:
         """
         Create audio based on a defined wavefunction and volume function.
         :param wave_func: Function that takes in time array and returns array
-            of amplitudes.
+            of amplitudes. Must be element-wise in t, as it is evaluated one
+            tile of tile_size samples at a time.
         :param vol_func: Function that takes in time array and returns array
             of modulation coefficients.
         :param frequency: Frequency of wave.
@@ -105,31 +136,99 @@ class PygAudio:
         if scale is None:
             scale = 1
 
-        # attempt to convert channel value to something logical
-        if channel is None:
-            channel = "both" if self.num_channels == 2 else "left"
-        if channel not in ("left", "right", "both"):
-            raise ValueError(f"{channel=} has to be 'left' or 'right' or"
-                             " 'both'")
-        if channel != "left" and self.num_channels == 1:
-            channel = "left"
+        # wave values are single precision, but frequency and phase stay
+        # double precision as the phase argument needs it on long clips
+        amplitude = np.float32(amplitude)
+
+        channel = self._resolve_channel(channel)
 
         # segment of time array the wave lasts for
         wave_time = self.t[start_offset:stop_offset+1]
-        # modulation starts relative to t=offset
-        modulation = vol_func(wave_time - wave_time[0], scale)
-        # wave starts relative to t=0
-        wave = wave_func(wave_time, frequency, amplitude, phase)
-        # modulated wave
-        mod_audio = modulation * wave
-
-        # add audio to relevant channels
-        if channel == "left" or channel == "both":
-            amp_segment = self.collected_amp[start_offset:stop_offset+1, 0]
-            amp_segment += mod_audio
-        if channel == "right" or channel == "both":
-            amp_segment = self.collected_amp[start_offset:stop_offset+1, 1]
-            amp_segment += mod_audio
+        # modulation starts relative to t=offset, over the whole segment as
+        # vol_func may depend on its length. Constant envelope is a no-op so
+        # it is neither built nor applied
+        modulation = None
+        if vol_func is not constant_envelope:
+            modulation = vol_func(wave_time - wave_time[0], scale)
+
+        # build the wave a tile at a time so each tile of collected audio is
+        # still in cache when the modulated wave is added to it
+        scratch = np.empty(self.tile_size, dtype=np.float32)
+        for tile_start, tile_stop in self._tiles(start_offset,
+                                                 stop_offset + 1):
+            # wave starts relative to t=0
+            wave = wave_func(self.t[tile_start:tile_stop], frequency,
+                             amplitude, phase)
+            # modulated wave, written into a scratch tile as the array
+            # returned by wave_func may be shared, read-only or integer
+            if modulation is not None:
+                wave = np.multiply(
+                    modulation[tile_start-start_offset:tile_stop-start_offset],
+                    wave, out=scratch[:tile_stop-tile_start])
+
+            self._add_to_channels(tile_start, tile_stop, wave, channel)
+
+    def create_waves_batched(self, wave_func: Callable[[np.ndarray,
+                                                        float,
+                                                        float,
+                                                        Optional[float]],
+                                                       np.ndarray],
+                             vol_func: Callable[[np.ndarray,
+                                                 Optional[float]],
+                                                np.ndarray],
+                             specs: List[Tuple[float, ...]],
+                             scale: Optional[float] = None,
+                             channel: Optional[str] = None) -> None:
+        """
+        Create audio from several waves that share a wavefunction and volume
+            function and last for the entire audio. Waves are summed one
+            tile of the time array at a time, so the collected audio is only
+            added to once.
+        :param wave_func: Function that takes in time array and returns array
+            of amplitudes. Must be element-wise in t, as it is evaluated one
+            tile of tile_size samples at a time.
+        :param vol_func: Function that takes in time array and returns array
+            of modulation coefficients.
+        :param specs: (frequency, amplitude) or (frequency, amplitude, phase)
+            of each wave. Phase is 0 if left out or None.
+        :param scale: (Optional) Scale for vol_func. 1 if None.
+        :param channel: Audio channel to create audio in.
+            ("left", "right", "both"). Defaults to "both".
+        """
+        if self.collected_amp is None:
+            raise UnboundLocalError("Construct time first with"
+                                    " `construct_time` before creating"
+                                    " waves.")
+
+        if scale is None:
+            scale = 1
+
+        waves = []
+        for spec in specs:
+            frequency, amplitude, phase = (tuple(spec) + (None,))[:3]
+            if phase is None:
+                phase = 0
+            waves.append((frequency, np.float32(amplitude), phase))
+
+        channel = self._resolve_channel(channel)
+
+        # envelope is shared, so it is applied once to the summed waves
+        modulation = None
+        if vol_func is not constant_envelope:
+            modulation = vol_func(self.t - self.t[0], scale)
+
+        # one scratch tile reused across the whole loop
+        scratch = np.empty(self.tile_size, dtype=np.float32)
+        for tile_start, tile_stop in self._tiles(0, len(self.t)):
+            tile_time = self.t[tile_start:tile_stop]
+            tile_audio = scratch[:len(tile_time)]
+            tile_audio.fill(0)
+            for frequency, amplitude, phase in waves:
+                tile_audio += wave_func(tile_time, frequency, amplitude, phase)
+            if modulation is not None:
+                tile_audio *= modulation[tile_start:tile_stop]
+
+            self._add_to_channels(tile_start, tile_stop, tile_audio, channel)
 
     def insert_audio(self, audio: np.ndarray,
                      scale: Optional[float] = None,
@@ -175,50 +274,74 @@ class PygAudio:
         if scale is None:
             scale = 1
 
-        # attempt to convert channel value to something logical
-        if channel is None:
-            channel = "both" if self.num_channels == 2 else "left"
-        if channel not in ("left", "right", "both"):
-            raise ValueError(f"{channel=} has to be 'left' or 'right' or"
-                             " 'both'")
-        if channel != "left" and self.num_channels == 1:
-            channel = "left"
+        channel = self._resolve_channel(channel)
 
-        # force length
-        audio = np.resize(audio, stop_offset - start_offset + 1)
+        # force length, flattened like np.resize does. Contiguous audio that
+        # is long enough is only read through a view and never copied
+        length = stop_offset - start_offset + 1
+        audio = np.ravel(audio)
+        if len(audio) >= length:
+            audio = audio[:length]
+        else:
+            audio = np.resize(audio, length)
 
-        if vol_func is None:
-            vol_func = self.constant_volume
+        mod_audio = audio
+        if vol_func is not None and vol_func is not constant_envelope:
+            # segment of time array the wave lasts for
+            wave_time = self.t[start_offset:stop_offset+1]
+            # modulation starts relative to t=offset
+            modulation = vol_func(wave_time - wave_time[0], scale)
+            # modulated audio, in a fresh float32 array as the array returned
+            # by vol_func may be shared or read-only
+            mod_audio = np.multiply(modulation, audio, dtype=np.float32)
 
-        # segment of time array the wave lasts for
-        wave_time = self.t[start_offset:stop_offset+1]
-        # modulation starts relative to t=offset
-        modulation = vol_func(wave_time - wave_time[0], scale)
-        # modulated audio
-        mod_audio = modulation * audio
-
-        # add audio to relevant channels
-        if channel == "left" or channel == "both":
-            amp_segment = self.collected_amp[start_offset:stop_offset+1, 0]
-            amp_segment += mod_audio
-        if channel == "right" or channel == "both":
-            amp_segment = self.collected_amp[start_offset:stop_offset+1, 1]
-            amp_segment += mod_audio
+        self._add_to_channels(start_offset, stop_offset + 1, mod_audio,
+                              channel)
 
     def play_sound(self) -> None:
-        amp = (self.collected_amp
-               * self.relative_amp
-               * self.max_amp
-               / np.max(self.collected_amp)).astype(np.int16)
+        if self.side_amp is None:
+            peak = np.max(self.collected_amp)
+        else:
+            # larger of left and right is collected + |side|
+            peak = np.max(self.collected_amp + np.abs(self.side_amp))
+        scale = np.float32(self.relative_amp * self.max_amp / peak)
+
+        # stream chunks through the queue of a mixer channel, so playback
+        # starts once the first chunk is normalised and the int16 output is
+        # never held in full. The channel is reserved up front so every
+        # chunk goes to the same one
+        channel = pygame.mixer.find_channel(True)
+        # monotonic times for when the channel's queue frees up and when all
+        # queued chunks have finished, pygame's ticks only start counting
+        # once its timer is used so they can't be relied on here
+        queue_free_time = end_time = time.monotonic()
+        for chunk_start in range(0, len(self.collected_amp),
+                                 self.stream_chunk):
+            chunk_stop = min(chunk_start + self.stream_chunk,
+                             len(self.collected_amp))
+            sound = pygame.sndarray.make_sound(
+                self._normalised_chunk(chunk_start, chunk_stop, scale))
 
-        if self.num_channels == 1:
-            # reshape to 2 channels because mono is broken
-            amp = np.repeat(amp, 2, axis=1)
+            if chunk_start == 0:
+                channel.play(sound)
+                queue_free_time = time.monotonic()
+                end_time = queue_free_time + sound.get_length()
+                continue
 
-        sound = pygame.sndarray.make_sound(amp)
-        sound.play()
+            # a channel only queues one sound, sleep until the queued chunk
+            # has started before queueing the next one
+            time.sleep(max(0., queue_free_time - time.monotonic()))
+            while channel.get_queue() is not None:
+                pygame.time.wait(5)
+            channel.queue(sound)
+            queue_free_time = end_time
+            end_time += sound.get_length()
+
+        # sleep through the known length of the sound instead of polling,
+        # then only poll briefly for the tail still in the mixer buffer
+        time.sleep(max(0., end_time - time.monotonic()))
         while pygame.mixer.get_busy():
-            pygame.time.delay(100)
+            pygame.time.wait(5)
 
     def time_to_offset(self, time: float) -> int:
         """
@@ -226,3 +349,80 @@ class PygAudio:
         :param time: Time to convert to offset.
         """
         return int(time * self.sample_rate)
+
+    def _normalised_chunk(self, start: int, stop: int,
+                          scale: float) -> np.ndarray:
+        """
+        Normalise a range of the collected audio straight into a stereo
+            int16 array for playback. Always 2 channels because mono is
+            broken.
+        :param start: Starting index of time array.
+        :param stop: Index of time array to stop before.
+        :param scale: Factor converting collected audio to int16 amplitudes.
+        """
+        amp = np.empty((stop - start, 2), dtype=np.int16)
+        collected = self.collected_amp[start:stop]
+
+        if self.side_amp is None:
+            # broadcast the shared audio into both channels in one pass
+            np.multiply(collected[:, np.newaxis], scale, out=amp,
+                        casting="unsafe")
+        else:
+            side = self.side_amp[start:stop]
+            np.multiply(collected + side, scale, out=amp[:, 0],
+                        casting="unsafe")
+            np.multiply(collected - side, scale, out=amp[:, 1],
+                        casting="unsafe")
+        return amp
+
+    def _resolve_channel(self, channel: Optional[str]) -> str:
+        """
+        Attempt to convert channel value to something logical.
+        :param channel: Audio channel ("left", "right", "both") or None.
+        """
+        if channel is None:
+            channel = "both" if self.num_channels == 2 else "left"
+        if channel not in ("left", "right", "both"):
+            raise ValueError(f"{channel=} has to be 'left' or 'right' or"
+                             " 'both'")
+        if channel != "left" and self.num_channels == 1:
+            channel = "left"
+        return channel
+
+    def _tiles(self, start: int, stop: int) -> Iterator[Tuple[int, int]]:
+        """
+        Split a range of the time array into tiles aligned to tile_size.
+        :param start: Starting index of time array.
+        :param stop: Index of time array to stop before.
+        :return: (start, stop) of each tile.
+        """
+        tile_start = start
+        while tile_start < stop:
+            tile_stop = min((tile_start // self.tile_size + 1)
+                            * self.tile_size, stop)
+            yield tile_start, tile_stop
+            tile_start = tile_stop
+
+    def _add_to_channels(self, start: int, stop: int,
+                         audio: np.ndarray, channel: str) -> None:
+        """
+        Add audio to the relevant channels of the collected audio.
+        :param start: Starting index of time array to add audio at.
+        :param stop: Index of time array to stop before.
+        :param audio: Array of amplitudes, same length as stop - start.
+        :param channel: Audio channel to add audio in.
+            ("left", "right", "both").
+        """
+        if channel == "both" or self.num_channels == 1:
+            self.collected_amp[start:stop] += audio
+        else:
+            # a single stereo channel is half shared audio and half
+            # difference, left = collected + side and right = collected - side
+            if self.side_amp is None:
+                self.side_amp = _aligned_zeros(len(self.collected_amp))
+            half_audio = np.multiply(audio, 0.5)
+            self.collected_amp[start:stop] += half_audio
+            if channel == "left":
+                self.side_amp[start:stop] += half_audio
+            else:
+                self.side_amp[start:stop] -= half_audio
@@ -6,6 +6,32 @@ Common waveform methods.
 """
 
 
+def _phase(t: np.ndarray,
+           freq: float,
+           phi: float,
+           offset: Optional[float] = None) -> np.ndarray:
+    """
+    Phase of wave in cycles, wrapped to [0, 1). Phase offsets are folded
+    into a single scalar so building the phase costs one multiply and one
+    add per sample. The phase is built in double precision, since a float32
+    freq*t loses phase on long clips, and only the wrapped phase is
+    returned as float32.
+    :param t: Array of timesteps.
+    :param freq: Frequency of wave.
+    :param phi: Phase of wave in radians.
+    :param offset: (Optional) Additional phase in cycles. Defaults to 0.
+    """
+    if offset is None:
+        offset = 0
+    cycles = np.multiply(t, freq, dtype=np.float64)
+    cycles += phi / (2 * np.pi) + offset
+    # floor and subtract instead of np.remainder, which is a slow scalar
+    # fmod loop for floats. The float32 cast happens in the subtract
+    wrapped = np.empty(cycles.shape, dtype=np.float32)
+    np.subtract(cycles, np.floor(cycles), out=wrapped)
+    return wrapped
+
+
 def sin(t: np.ndarray,
         freq: float,
         amp: float,
@@ -18,7 +44,14 @@ def sin(t: np.ndarray,
     """
     if phi is None:
         phi = 0
-    return amp * np.sin(2 * np.pi * freq * t + phi)
+
+    # wrapped phase keeps the float32 sin argument within [0, 2pi), which
+    # stays on numpy's vectorised path for long clips
+    wave = _phase(t, freq, phi)
+    wave *= np.float32(2 * np.pi)
+    np.sin(wave, out=wave)
+    wave *= amp
+    return wave
 
 
 def saw(t: np.ndarray,
@@ -34,9 +67,13 @@ def saw(t: np.ndarray,
     if phi is None:
         phi = 0
 
-    # trigonometric form is ~2x as fast as remainder form
-    return ((2 * amp / np.pi)
-            * np.arctan(np.tan(np.pi * freq * t + phi / 2)))
+    # fractional cycle from floor-subtract in _phase, np.remainder would be
+    # slower than the arctan(tan(x)) form. Shifted by half a cycle so the
+    # wave is 0 at phase 0
+    wave = _phase(t, freq, phi, 0.5)
+    wave -= 0.5
+    wave *= 2 * amp
+    return wave
 
 
 def square(t: np.ndarray,
@@ -51,7 +88,14 @@ def square(t: np.ndarray,
     """
     if phi is None:
         phi = 0
-    return amp * np.sign(np.sin(2 * np.pi * freq * t + phi))
+
+    # +amp for the first half of each cycle and -amp for the second, from a
+    # comparison mask instead of the sign of a sine
+    wave = _phase(t, freq, phi)
+    np.greater_equal(wave, 0.5, out=wave)
+    wave *= -2 * amp
+    wave += amp
+    return wave
 
 
 def triangle(t: np.ndarray,
@@ -67,6 +111,12 @@ def triangle(t: np.ndarray,
     if phi is None:
         phi = 0
 
-    # trigonometric form is ~2x as fast as remainder form
-    return ((2 * amp / np.pi)
-            * np.arcsin(np.sin(2 * np.pi * freq * t + phi)))
+    # fractional cycle from floor-subtract in _phase, np.remainder would be
+    # slower than the arcsin(sin(x)) form. Shifted by a quarter cycle so the
+    # wave is 0 at phase 0 and peaks a quarter cycle in
+    wave = _phase(t, freq, phi, 0.25)
+    wave -= 0.5
+    np.abs(wave, out=wave)
+    wave *= -4 * amp
+    wave += amp
+    return wave